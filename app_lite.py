@@ -3,39 +3,86 @@ from __future__ import annotations
 import os
 import sys
 import streamlit as st
+import base64
 import datetime
+import hashlib
 import random
+import re
 import time
-import uuid
-from typing import List, Dict
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Iterable
 import requests
-import json
 
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from dotenv import load_dotenv  # type: ignore
-from groq import Groq
 
-from utils.loader import load_profile
+from utils.loader import DATA_DIR, load_profile
+from utils.prompting import MODE_FILES, PROMPTS_DIR, load_mode_texts, load_system_prompt
 from utils.logging_utils import get_logger
 # Updated import to use deployment-ready retriever
-from rag.retriever_deployment import retrieve_with_prebuilt as retrieve
+from rag.retriever_deployment import (
+    retrieve_with_prebuilt as retrieve,
+    embed_query,
+    get_embedding_model,
+    load_prebuilt_index,
+    prewarm,
+)
+from rag.semantic_cache import SemanticCache
+
+if TYPE_CHECKING:
+    from groq import Groq
 
 logger = get_logger("codex.app")
 
 ROOT_DIR = os.path.dirname(__file__)
-PROMPTS_DIR = os.path.join(ROOT_DIR, "prompts")
+PROFILE_PATH = os.path.join(DATA_DIR, "profile.yaml")
+
+# Private RNG so greetings don't share the global one
+_rng = random.Random()
+
+@st.cache_resource(show_spinner=False)
+def get_log_executor() -> ThreadPoolExecutor:
+    """Background workers for network logging so it never blocks a chat turn"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="codex-log")
+
+@st.cache_resource(show_spinner=False)
+def get_retrieval_executor() -> ThreadPoolExecutor:
+    """Worker that runs retrieval while the prompt blocks are loaded"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="codex-retrieve")
+
+@st.cache_resource(show_spinner=False)
+def get_http_session() -> requests.Session:
+    """Shared session so the connection to Google Forms is kept alive"""
+    return requests.Session()
+
+def _submit_form(session: requests.Session, form_url: str, form_data: Dict[str, str]):
+    """POST a logged question to the Google Form (runs on the log executor)"""
+    try:
+        response = session.post(form_url, data=form_data, timeout=5)
+
+        if response.status_code == 200:
+            logger.info("Question logged to Google Sheets successfully")
+        else:
+            logger.warning(f"Google Sheets logging failed: {response.status_code}")
+    except Exception as e:
+        logger.error(f"Failed to submit question to Google Sheets: {e}")
+
+@st.cache_resource(show_spinner=False)
+def get_logs_dir() -> str:
+    """Create the local logs directory once per process"""
+    logs_dir = os.path.join(ROOT_DIR, "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    return logs_dir
 
 def log_question(question: str):
     """Log question to Google Sheets via Google Forms"""
     try:
         # Local logging (for development)
-        logs_dir = os.path.join(ROOT_DIR, "logs")
-        os.makedirs(logs_dir, exist_ok=True)
-        
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        log_file = os.path.join(logs_dir, f"{today}.txt")
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+        now = datetime.datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        log_file = os.path.join(get_logs_dir(), f"{today}.txt")
+        timestamp = now.strftime("%H:%M:%S")
         
         with open(log_file, "a", encoding="utf-8") as f:
             f.write(f"[{timestamp}] {question}\n")
@@ -46,147 +93,254 @@ def log_question(question: str):
         question_field = os.environ.get("GOOGLE_FORM_QUESTION_FIELD")
         
         if form_url and timestamp_field and question_field:
-            timestamp_full = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            timestamp_full = f"{today} {timestamp}"
             
             form_data = {
                 timestamp_field: timestamp_full,
                 question_field: question
             }
             
-            # Submit to Google Form
-            response = requests.post(form_url, data=form_data, timeout=5)
-            
-            if response.status_code == 200:
-                logger.info("Question logged to Google Sheets successfully")
-            else:
-                logger.warning(f"Google Sheets logging failed: {response.status_code}")
-                
+            # Submit to Google Form in the background
+            get_log_executor().submit(_submit_form, get_http_session(), form_url, form_data)
+
     except Exception as e:
         logger.error(f"Failed to log question: {e}")
 
+@st.cache_resource(show_spinner=False)
 def get_client() -> Groq:
+    # Imported lazily: the SDK is only needed once the first question is asked
+    from groq import Groq
+
     key = os.environ.get("GROQ_API_KEY")
     if not key:
         raise RuntimeError("GROQ_API_KEY is not set. Get free API key from https://console.groq.com/")
-    
-    try:
-        return Groq(api_key=key)
-    except Exception as e:
-        return Groq(api_key=key)
+    return Groq(api_key=key)
+
+def response_cache_fingerprint() -> str:
+    """Identify the index, prompts, profile and model override answers are generated from"""
+    cache_dir = os.path.join(ROOT_DIR, "rag", "cache")
+    paths = [os.path.join(cache_dir, "index.faiss"), os.path.join(cache_dir, "meta.json"), PROFILE_PATH]
+    paths += [os.path.join(PROMPTS_DIR, name) for name in sorted(os.listdir(PROMPTS_DIR))]
+
+    digest = hashlib.sha1((get_model_override() or "").encode("utf-8"))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{os.path.basename(path)}:{stat.st_mtime_ns}:{stat.st_size};".encode("utf-8"))
+        except FileNotFoundError:
+            digest.update(f"{os.path.basename(path)}:missing;".encode("utf-8"))
+    return digest.hexdigest()
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache() -> SemanticCache:
+    """Process-wide cache of answers shared by all sessions, persisted across restarts"""
+    return SemanticCache(
+        path=os.path.join(ROOT_DIR, "rag", "cache", "semcache.sqlite"),
+        fingerprint=response_cache_fingerprint(),
+    )
+
+@st.cache_data(show_spinner=False)
+def _load_profile_block(mtime: float) -> str:
+    """Parse the profile once per profile.yaml version"""
+    return load_profile(PROFILE_PATH).to_prompt_block()
+
+@st.cache_resource(show_spinner=False)
+def _build_static_messages(mode: str, profile_mtime: float) -> tuple:
+    return (
+        {"role": "system", "content": load_system_prompt()},
+        {"role": "system", "content": f"PROFILE\n{_load_profile_block(profile_mtime)}"},
+        {"role": "system", "content": f"MODE\n{load_mode_texts()[mode]}"},
+    )
+
+def get_static_messages(mode: str) -> tuple:
+    """System/profile/mode messages, built once per mode (shared; do not mutate)"""
+    return _build_static_messages(mode, os.path.getmtime(PROFILE_PATH))
 
-def load_text(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
 
 
+MORNING_GREETINGS = ("Good morning! Ready for some questions?", "Morning! What would you like to know?", "Rise and shine! Let's chat!")
+AFTERNOON_GREETINGS = ("Good afternoon! How can I help?", "Afternoon! What's on your mind?", "Hey there! Ready to explore?")
+EVENING_GREETINGS = ("Good evening! What brings you here?", "Evening! Let's dive into some questions!", "Hey! Perfect time for a chat!")
+NIGHT_GREETINGS = ("Working late? Let's chat!", "Night owl? I'm here to help!", "Burning the midnight oil? Ask away!")
 
 def get_dynamic_greeting() -> str:
     """Return a greeting based on time of day"""
     hour = datetime.datetime.now().hour
     if 5 <= hour < 12:
-        greetings = ["Good morning! Ready for some questions?", "Morning! What would you like to know?", "Rise and shine! Let's chat!"]
+        greetings = MORNING_GREETINGS
     elif 12 <= hour < 17:
-        greetings = ["Good afternoon! How can I help?", "Afternoon! What's on your mind?", "Hey there! Ready to explore?"]
+        greetings = AFTERNOON_GREETINGS
     elif 17 <= hour < 22:
-        greetings = ["Good evening! What brings you here?", "Evening! Let's dive into some questions!", "Hey! Perfect time for a chat!"]
+        greetings = EVENING_GREETINGS
     else:
-        greetings = ["Working late? Let's chat!", "Night owl? I'm here to help!", "Burning the midnight oil? Ask away!"]
+        greetings = NIGHT_GREETINGS
     
-    return random.choice(greetings)
-
-def generate_related_questions(query: str, retrieval_data: Dict) -> List[str]:
-    """Generate related questions based on the query and retrieved content"""
-    question_templates = [
-        "Can you tell me more about {}?",
-        "What's your experience with {}?",
-        "How did you develop your skills in {}?",
-        "What challenges did you face with {}?",
-        "What's your biggest accomplishment in {}?"
-    ]
-    
-    # Extract key topics from the query and retrieved content
-    topics = []
-    query_words = query.lower().split()
-    
-    # Common professional topics that might be relevant
-    professional_topics = [
-        "leadership", "teamwork", "projects", "challenges", "goals", 
-        "achievements", "skills", "experience", "growth", "learning"
-    ]
-    
-    # Find topics mentioned in query
-    for topic in professional_topics:
-        if topic in query.lower():
-            topics.append(topic)
+    return _rng.choice(greetings)
+
+RELATED_QUESTION_TEMPLATES = (
+    "Can you tell me more about {}?",
+    "What's your experience with {}?",
+    "How did you develop your skills in {}?",
+    "What challenges did you face with {}?",
+    "What's your biggest accomplishment in {}?",
+)
+
+# Common professional topics that might be relevant
+PROFESSIONAL_TOPICS = (
+    "leadership", "teamwork", "projects", "challenges", "goals",
+    "achievements", "skills", "experience", "growth", "learning",
+)
+_TOPIC_RE = re.compile(r"\b(" + "|".join(map(re.escape, PROFESSIONAL_TOPICS)) + r")\b", re.IGNORECASE)
+
+GENERAL_TOPICS = ("your background", "your projects", "your skills", "your goals")
+
+def generate_related_questions(query: str) -> List[str]:
+    """Generate related questions based on the query"""
+    # Stable per question (crc32, not the salted hash()), so reruns show the same ones
+    seed = zlib.crc32(query.encode("utf-8"))
+
+    # Find topics mentioned in query (one regex pass, deduplicated in order)
+    topics = list(dict.fromkeys(m.lower() for m in _TOPIC_RE.findall(query)))
     
     # If no specific topics found, use general ones
     if not topics:
-        topics = random.sample(["your background", "your projects", "your skills", "your goals"], 2)
-    
-    # Generate related questions
-    related = []
-    for topic in topics[:2]:  # Limit to 2 topics
-        template = random.choice(question_templates)
-        related.append(template.format(topic))
+        start = seed % len(GENERAL_TOPICS)
+        topics = [GENERAL_TOPICS[start], GENERAL_TOPICS[(start + 1) % len(GENERAL_TOPICS)]]
     
-    return related
+    return [
+        RELATED_QUESTION_TEMPLATES[(seed + i) % len(RELATED_QUESTION_TEMPLATES)].format(topic)
+        for i, topic in enumerate(topics[:2])  # Limit to 2 topics
+    ]
 
-def typing_animation(text: str, container):
-    """Simple typing animation effect"""
-    placeholder = container.empty()
-    displayed_text = ""
-    
-    for char in text:
-        displayed_text += char
-        placeholder.markdown(displayed_text + "▌")
-        time.sleep(0.02)  # Adjust speed here
-    
-    placeholder.markdown(text)  # Final text without cursor
-
-def get_mode_file(mode: str) -> str:
-    mapping = {
-        "Interview": "mode_interview.txt",
-        "Storytelling": "mode_storytelling.txt",
-        "Fast Facts": "mode_fastfacts.txt",
-        "Humble Brag": "mode_humblebrag.txt",
-        "Reflective": "mode_reflective.txt",
-        "Humorous": "mode_humorous.txt"
-    }
-    return os.path.join(PROMPTS_DIR, mapping[mode])
+def iter_completion_text(response) -> Iterable[str]:
+    """Yield the content deltas of a streamed Groq completion"""
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+STREAM_FLUSH_INTERVAL = 0.05  # seconds; at most ~20 UI updates per second
+
+def throttle_stream(pieces: Iterable[str], interval: float = STREAM_FLUSH_INTERVAL) -> Iterable[str]:
+    """Coalesce stream pieces so the UI redraws at most once per interval"""
+    buffer = []
+    last_flush = time.monotonic()
+    for piece in pieces:
+        buffer.append(piece)
+        now = time.monotonic()
+        if now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = now
+    if buffer:
+        yield "".join(buffer)
+
+# Short-answer modes go to a fast 8B model, long-form ones to 70B
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+MODE_MODELS = {
+    "Fast Facts": "llama-3.1-8b-instant",
+    "Humble Brag": "llama-3.1-8b-instant",
+    "Interview": "llama-3.1-8b-instant",
+    "Humorous": "llama-3.1-8b-instant",
+    "Reflective": "llama-3.3-70b-versatile",
+    "Storytelling": "llama-3.3-70b-versatile",
+}
+
+@st.cache_resource(show_spinner=False)
+def get_model_override() -> str | None:
+    """GROQ_MODEL pins one model for every mode (read once, after load_dotenv)"""
+    return os.environ.get("GROQ_MODEL")
+
+def get_model(mode: str) -> str:
+    return get_model_override() or MODE_MODELS.get(mode, DEFAULT_MODEL)
+
+# Completion budget per mode; short-answer modes don't need 1024 tokens
+MODE_MAX_TOKENS = {
+    "Fast Facts": 256,
+    "Humble Brag": 512,
+    "Interview": 768,
+    "Humorous": 512,
+    "Reflective": 1024,
+    "Storytelling": 1024,
+}
+THIN_CONTEXT_SCORE = 0.3
+THIN_CONTEXT_MAX_TOKENS = 256
+
+def get_max_tokens(mode: str, r: Dict) -> int:
+    """Cap the completion length by mode, and tightly when context is thin"""
+    max_tokens = MODE_MAX_TOKENS.get(mode, 1024)
+    if r["max_score"] < THIN_CONTEXT_SCORE:
+        max_tokens = min(max_tokens, THIN_CONTEXT_MAX_TOKENS)
+    return max_tokens
+
+WEAK_CONTEXT_ANSWER = (
+    "I don't have enough context in my documents to answer that confidently. "
+    "Try rephrasing, or add a relevant doc (e.g., project README with metrics, "
+    "performance review, or case study) so I can answer from it."
+)
+
+def compose_messages(question: str, mode: str, reflective: bool,
+                     query_embedding=None) -> tuple[List[Dict[str, str]] | None, Dict, bool]:
+    """Build the chat messages for a question; messages is None when context is weak"""
+    # Retrieve context using pre-built embeddings, overlapping with the prompt loads
+    # (FAISS and the encoder release the GIL, so the worker runs concurrently)
+    retrieval = get_retrieval_executor().submit(
+        retrieve, question, top_k=4, prioritize_reflection=reflective, query_embedding=query_embedding
+    )
 
-def compose_messages(question: str, mode: str, reflective: bool) -> tuple[List[Dict[str, str]], Dict]:
-    prof = load_profile()
-    system = load_text(os.path.join(PROMPTS_DIR, "system_base.txt"))
-    mode_text = load_text(get_mode_file(mode))
+    # Cached prompt blocks stay on the script thread, where Streamlit's context lives
+    static_messages = get_static_messages(mode)
 
-    # Retrieve context using pre-built embeddings
-    r = retrieve(question, top_k=4, prioritize_reflection=reflective)
+    r = retrieval.result()
 
-    # Guardrail: if weak, steer the assistant to refuse gracefully
+    # Guardrail: weak context is answered with WEAK_CONTEXT_ANSWER, not the LLM
     min_required = 0.20  # cosine similarity threshold heuristic
     weak = r["count"] == 0 or r["max_score"] < min_required or r["avg_score"] < 0.18
+    if weak:
+        return None, r, True
 
-    context = "\n\n".join([
-        f"[Source: {os.path.basename(x['source'])}#{x['heading']}]\n{x['text']}" for x in r["results"]
-    ])
+    context = "\n\n".join(
+        f"[Source: {filename}#{heading}]\n{text}"
+        for filename, heading, text in zip(r["filenames"], r["headings"], r["texts"])
+    )
 
     messages = [
-        {"role": "system", "content": system},
-        {"role": "system", "content": f"PROFILE\n{prof.to_prompt_block()}"},
-        {"role": "system", "content": f"MODE\n{mode_text}"},
+        *static_messages,
         {"role": "system", "content": f"CONTEXT\n{context}"},
+        {"role": "user", "content": question},
     ]
 
-    if weak:
-        missing_hint = (
-            "Context appears thin. If you cannot answer strictly from CONTEXT and PROFILE, say what's missing "
-            "and suggest adding a relevant doc (e.g., project README with metrics, performance review, or case study)."
-        )
-        messages.append({"role": "system", "content": missing_hint})
-
-    messages.append({"role": "user", "content": question})
+    return messages, r, False
+
+def slim_retrieval(r: Dict) -> Dict:
+    """Drop chunk text from a retrieval, keeping what the UI needs on a cache hit"""
+    return {
+        "results": [
+            {"source": x["source"], "filename": x["filename"], "heading": x["heading"], "score": x["score"]}
+            for x in r["results"]
+        ],
+        "filenames": r["filenames"],
+        "headings": r["headings"],
+        "count": r["count"],
+        "max_score": r["max_score"],
+        "avg_score": r["avg_score"],
+    }
 
-    return messages, r
+# Sample quick-start questions (also pre-embedded at startup)
+SAMPLE_QUESTIONS = (
+    "Tell me about yourself",
+    "Describe what you like to do in the evenings?",
+    "What are your key accomplishments?",
+    "How do you approach problem-solving?",
+    "Where do you see yourself in 10 years?",
+)
+
+@st.cache_resource(show_spinner="Loading knowledge base...")
+def warm_retriever() -> bool:
+    """Load the FAISS index and embedding model once per process, before the first question"""
+    load_prebuilt_index()
+    ready = get_embedding_model() is not None
+    prewarm(SAMPLE_QUESTIONS)
+    return ready
 
 def check_prebuilt_index():
     """Check if pre-built index exists, show instructions if not"""
@@ -207,17 +361,21 @@ def check_prebuilt_index():
     return True
 
 # Render deployment fix
-import os
 if "PORT" in os.environ:
     # Running on Render - configure for external access
     os.environ.setdefault("STREAMLIT_SERVER_PORT", os.environ["PORT"])
     os.environ.setdefault("STREAMLIT_SERVER_ADDRESS", "0.0.0.0")
 
+@st.cache_data(show_spinner=False)
+def _encode_image_base64(image_path: str, mtime: float) -> str:
+    """Encode an image once per (path, mtime); mtime invalidates on change"""
+    with open(image_path, "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
 def get_background_image_base64(image_path: str) -> str:
     """Convert image to base64 string for CSS background"""
     try:
-        with open(image_path, "rb") as f:
-            return base64.b64encode(f.read()).decode()
+        return _encode_image_base64(image_path, os.path.getmtime(image_path))
     except FileNotFoundError:
         return ""
 
@@ -228,11 +386,14 @@ def main():
         layout="wide"
     )
 
+    from dotenv import load_dotenv  # type: ignore
+
     load_dotenv()
 
     # Check if pre-built index exists
     if not check_prebuilt_index():
         st.stop()
+    warm_retriever()
 
     # Sidebar controls
     with st.sidebar:
@@ -240,7 +401,7 @@ def main():
         
         mode = st.radio(
             "**Response Mode**",
-            options=["Interview", "Storytelling", "Fast Facts", "Humble Brag", "Reflective", "Humorous"],
+            options=list(MODE_FILES),
             index=0,
         )
         
@@ -276,20 +437,13 @@ def main():
 
     # Sample quick-start questions
     st.markdown("### Quick Start Questions")
-    sample_qs = [
-        "Tell me about yourself",
-        "Describe what you like to do in the evenings?",
-        "What are your key accomplishments?", 
-        "How do you approach problem-solving?",
-        "Where do you see yourself in 10 years?",
-    ]
+    sample_qs = SAMPLE_QUESTIONS
 
     # Create button layout for quick start questions
     cols = st.columns(len(sample_qs))
-    for i, (col, q) in enumerate(zip(cols, sample_qs)):
-        with col:
-            if st.button(q, key=f"q_{i}"):
-                st.session_state["last_question"] = q
+    for i, q in enumerate(sample_qs):
+        if cols[i].button(q, key=f"q_{i}"):
+            st.session_state["last_question"] = q
 
     st.markdown("---")
     
@@ -330,28 +484,49 @@ def main():
             st.markdown(q)
 
         try:
-            messages, r = compose_messages(q, mode, reflective)
-            client = get_client()
-            model = os.environ.get("GROQ_MODEL", "llama3-8b-8192")
+            # Answer repeat and near-repeat questions from the response cache
+            response_cache = get_response_cache()
+            try:
+                query_embedding = embed_query(q)
+            except RuntimeError as e:
+                # No embedding model: exact cache hits still work, and retrieval
+                # reports the error so the answer falls back to weak context
+                logger.warning(f"Query embedding unavailable: {e}")
+                query_embedding = None
+            cached = response_cache.get(q, mode, reflective, query_embedding)
 
             with st.chat_message("assistant", avatar="assets/avatar-ai.png"):
-                # Show typing animation
-                typing_container = st.empty()
-                with st.spinner("Thinking..."):
-                    response = client.chat.completions.create(
-                        model=model,
-                        messages=messages,
-                        temperature=temperature,
-                        max_tokens=1024,
-                    )
-
-                assistant_content = response.choices[0].message.content
-
-                # Simple typing effect
-                typing_animation(assistant_content, typing_container)
+                if cached:
+                    assistant_content, r = cached
+                    st.markdown(assistant_content)
+                else:
+                    messages, r, weak = compose_messages(q, mode, reflective, query_embedding)
+
+                    if weak:
+                        # Nothing relevant retrieved: answer without an LLM round-trip
+                        assistant_content = WEAK_CONTEXT_ANSWER
+                        st.markdown(assistant_content)
+                    else:
+                        client = get_client()
+                        model = get_model(mode)
+
+                        # Stream tokens into the message as they arrive
+                        with st.spinner("Thinking..."):
+                            response = client.chat.completions.create(
+                                model=model,
+                                messages=messages,
+                                temperature=temperature,
+                                max_tokens=get_max_tokens(mode, r),
+                                stream=True,
+                            )
+
+                        assistant_content = st.write_stream(throttle_stream(iter_completion_text(response)))
+                        if assistant_content:
+                            response_cache.put(q, mode, reflective, assistant_content,
+                                               slim_retrieval(r), query_embedding)
 
                 # Generate related questions
-                related_questions = generate_related_questions(q, r)
+                related_questions = generate_related_questions(q)
 
                 # Store message with metadata
                 msg_data = {
@@ -360,8 +535,9 @@ def main():
                     "related_questions": related_questions
                 }
 
-                if show_sources and r.get("results"):
-                    sources = ", ".join([os.path.basename(x['source']) for x in r["results"]])
+                if show_sources and r.get("filenames"):
+                    # Several chunks often come from one file; list each file once
+                    sources = ", ".join(dict.fromkeys(r["filenames"]))
                     msg_data["sources"] = sources
 
                 st.session_state["messages"].append(msg_data)
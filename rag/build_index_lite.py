@@ -8,13 +8,14 @@ from typing import Dict, List
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import faiss
-import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from utils.atomic_io import atomic_path
 from utils.loader import load_markdown_files
 from utils.logging_utils import get_logger
-from rag.splitter import chunk_markdown
+from rag.splitter import split_markdown
+from rag.index_factory import build_faiss_index, encode_chunks, write_binary_index, write_faiss_index
+from rag.chunk_store import write_chunk_store
 
 
 logger = get_logger("codex.build_index")
@@ -57,8 +58,8 @@ def build_index() -> Dict:
 
     # Chunk all documents
     all_chunks = []
-    for doc in docs:
-        chunks = chunk_markdown(doc["content"], doc["path"])
+    for path, content in docs:
+        chunks = split_markdown(content, path)
         all_chunks.extend(chunks)
 
     logger.info(f"Created {len(all_chunks)} chunks")
@@ -69,38 +70,25 @@ def build_index() -> Dict:
     # Load embedding model
     model = load_embedding_model()
 
-    # Create embeddings in batches to avoid memory issues
-    batch_size = 32
-    embeddings = []
+    texts = [chunk["text"] for chunk in all_chunks]
+    embeddings = encode_chunks(model, texts)
 
-    for i in range(0, len(all_chunks), batch_size):
-        batch = all_chunks[i:i + batch_size]
-        batch_texts = [chunk["text"] for chunk in batch]
-
-        try:
-            batch_embeddings = model.encode(batch_texts, convert_to_numpy=True, show_progress_bar=False)
-            embeddings.extend(batch_embeddings)
-            logger.info(f"Processed batch {i//batch_size + 1}/{(len(all_chunks) + batch_size - 1)//batch_size}")
-        except Exception as e:
-            logger.error(f"Failed to encode batch {i//batch_size + 1}: {e}")
-            raise
-
-    embeddings = np.array(embeddings).astype('float32')
     logger.info(f"Created embeddings shape: {embeddings.shape}")
 
     # Build FAISS index
     dimension = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dimension)  # Inner product (cosine similarity)
-
-    # Normalize embeddings for cosine similarity
-    faiss.normalize_L2(embeddings)
-    index.add(embeddings)
+    index = build_faiss_index(embeddings)
 
     # Save index and metadata
     index_path = os.path.join(cache_dir, "index.faiss")
     meta_path = os.path.join(cache_dir, "meta.json")
 
-    faiss.write_index(index, index_path)
+    write_faiss_index(index, index_path)
+
+    # Optional binary-quantized prefilter index (CODEX_BINARY_INDEX=1)
+    binary_path = write_binary_index(embeddings, cache_dir)
+    if binary_path:
+        logger.info(f"Binary index saved to {binary_path}")
 
     metadata = {
         "chunks": all_chunks,
@@ -109,10 +97,14 @@ def build_index() -> Dict:
         "model": model.get_sentence_embedding_dimension()
     }
 
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    # Chunks go to the columnar store; meta.json keeps only the header fields
+    write_chunk_store(all_chunks, cache_dir)
+    header = {k: v for k, v in metadata.items() if k != "chunks"}
+    with atomic_path(meta_path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2, ensure_ascii=False)
 
     logger.info(f"Index saved to {index_path}")
+    logger.info(f"Chunk store saved to {cache_dir}")
     logger.info(f"Metadata saved to {meta_path}")
 
     return metadata
@@ -0,0 +1,104 @@
+"""
+Columnar, memory-mapped storage for chunk metadata.
+Chunk texts live in one UTF-8 blob addressed by an offsets column, so loading
+is O(1) and only the chunks FAISS actually returns are read and decoded.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from contextlib import ExitStack
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from utils.atomic_io import atomic_path
+
+TEXT_BLOB = "chunks_text.bin"
+OFFSETS = "chunks_offsets.npy"
+SOURCE_IDS = "chunks_source_ids.npy"
+HEADING_IDS = "chunks_heading_ids.npy"
+STRINGS = "chunks_strings.json"
+
+STORE_FILES = (TEXT_BLOB, OFFSETS, SOURCE_IDS, HEADING_IDS, STRINGS)
+
+
+def has_chunk_store(cache_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(cache_dir, name)) for name in STORE_FILES)
+
+
+def _intern(values: List[str]) -> tuple[List[str], np.ndarray]:
+    """Map each value to an id into a list of distinct values"""
+    table: Dict[str, int] = {}
+    ids = np.fromiter((table.setdefault(v, len(table)) for v in values), dtype=np.int32, count=len(values))
+    return list(table), ids
+
+
+def write_chunk_store(chunks: List[Dict], cache_dir: str):
+    """Write chunks as columns: text blob + offsets, interned source/heading ids
+
+    Every column is written to a temporary file first and all of them are
+    swapped in at the end, so an open (memory-mapped) ChunkStore never sees a
+    half-rewritten file.
+    """
+    encoded = [chunk["text"].encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    sources, source_ids = _intern([chunk["source"] for chunk in chunks])
+    headings, heading_ids = _intern([chunk.get("heading", "") for chunk in chunks])
+
+    with ExitStack() as stack:
+        tmp = {name: stack.enter_context(atomic_path(os.path.join(cache_dir, name))) for name in STORE_FILES}
+
+        with open(tmp[TEXT_BLOB], "wb") as f:
+            f.write(b"".join(encoded))
+        # np.save on a path would append ".npy" to the temp name
+        for name, column in ((OFFSETS, offsets), (SOURCE_IDS, source_ids), (HEADING_IDS, heading_ids)):
+            with open(tmp[name], "wb") as f:
+                np.save(f, column)
+        with open(tmp[STRINGS], "w", encoding="utf-8") as f:
+            json.dump({"sources": sources, "headings": headings}, f, ensure_ascii=False)
+
+
+class ChunkStore:
+    """Read-only, list-like view over a chunk store; ``store[i]`` returns a chunk dict"""
+
+    def __init__(self, cache_dir: str):
+        self._offsets = np.load(os.path.join(cache_dir, OFFSETS), mmap_mode="r")
+        self._source_ids = np.load(os.path.join(cache_dir, SOURCE_IDS), mmap_mode="r")
+        self._heading_ids = np.load(os.path.join(cache_dir, HEADING_IDS), mmap_mode="r")
+
+        with open(os.path.join(cache_dir, STRINGS), "r", encoding="utf-8") as f:
+            strings = json.load(f)
+        self.sources: List[str] = strings["sources"]
+        self.headings: List[str] = strings["headings"]
+
+        blob_path = os.path.join(cache_dir, TEXT_BLOB)
+        if os.path.getsize(blob_path) == 0:
+            self._blob = b""
+        else:
+            with open(blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def text(self, i: int) -> str:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def source(self, i: int) -> str:
+        return self.sources[self._source_ids[i]]
+
+    def heading(self, i: int) -> str:
+        return self.headings[self._heading_ids[i]]
+
+    def __getitem__(self, i: int) -> Dict[str, str]:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {"text": self.text(i), "source": self.source(i), "heading": self.heading(i)}
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return (self[i] for i in range(len(self)))
@@ -0,0 +1,148 @@
+"""
+Chunk encoding and FAISS index construction shared by the index build entry points.
+All indexes use inner product over L2-normalized embeddings (cosine similarity).
+"""
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, List, Optional
+
+import faiss
+import numpy as np
+
+from utils.atomic_io import atomic_path
+from utils.logging_utils import get_logger
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = get_logger("codex.index_factory")
+
+# MiniLM on CPU is GEMM-bound; larger batches use BLAS better
+ENCODE_BATCH_SIZE = 128
+MIN_ENCODE_BATCH_SIZE = 8
+
+# Below HNSW_MIN_CHUNKS a brute-force scan is as fast as any graph/IVF index.
+# Above IVFPQ_MIN_CHUNKS even an int8 HNSW graph gets too large, so
+# vectors are product-quantized (which also needs >= 256 training points).
+HNSW_MIN_CHUNKS = 1000
+IVFPQ_MIN_CHUNKS = 100_000
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+IVFPQ_M = 8
+IVFPQ_NBITS = 8
+
+# Optional sign-bit prefilter read by the deployment retriever when present
+BINARY_INDEX_FILE = "index.bin"
+
+
+def encode_chunks(model: "SentenceTransformer", texts: List[str]) -> np.ndarray:
+    """Encode texts in batches, written straight into a preallocated array.
+
+    The encoder L2-normalizes each batch, so cosine similarity = inner product.
+    Only one batch of intermediate outputs is alive at a time, instead of
+    every batch plus the stacked copy encode() would otherwise build.
+    """
+    embeddings = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype='float32')
+    batch_size = ENCODE_BATCH_SIZE
+
+    start = 0
+    while start < len(texts):
+        batch_texts = texts[start:start + batch_size]
+        try:
+            embeddings[start:start + len(batch_texts)] = model.encode(
+                batch_texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        except (MemoryError, RuntimeError) as e:
+            if batch_size <= MIN_ENCODE_BATCH_SIZE:
+                logger.error(f"Failed to encode chunks {start}-{start + len(batch_texts)}: {e}")
+                raise
+            # Out of memory: retry the same slice with a smaller batch
+            batch_size //= 2
+            logger.warning(f"Encoding failed ({e}); retrying with batch_size={batch_size}")
+            continue
+        start += len(batch_texts)
+        logger.info(f"Encoded {start}/{len(texts)} chunks")
+
+    return embeddings
+
+
+def build_faiss_index(embeddings: np.ndarray) -> faiss.Index:
+    """Build an inner-product index over normalized embeddings, sized to the corpus.
+
+    - Small: brute-force IndexScalarQuantizer with int8 vectors.
+    - Medium: IndexHNSWSQ graph search (log N per query) over int8 vectors.
+    - Large: IndexIVFPQ (coarse clustering + product quantization).
+    """
+    count, dimension = embeddings.shape
+
+    if count < HNSW_MIN_CHUNKS:
+        index = faiss.IndexScalarQuantizer(
+            dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(embeddings)
+        index.add(embeddings)
+        return index
+
+    if count < IVFPQ_MIN_CHUNKS:
+        index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        index.train(embeddings)
+        index.add(embeddings)
+        logger.info(f"Built int8 HNSW index (M={HNSW_M}, efConstruction={HNSW_EF_CONSTRUCTION})")
+        return index
+
+    nlist = max(8, int(np.sqrt(count)))
+    quantizer = faiss.IndexFlatIP(dimension)
+    index = faiss.IndexIVFPQ(quantizer, dimension, nlist, IVFPQ_M, IVFPQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+    index.train(embeddings)
+    index.add(embeddings)
+    logger.info(f"Built IVF-PQ index (nlist={nlist}, m={IVFPQ_M}, nbits={IVFPQ_NBITS})")
+    return index
+
+
+def write_faiss_index(index: faiss.Index, index_path: str):
+    """Write an index by replacing the file, never rewriting it in place.
+
+    A running app may still be reading the old file (IVF inverted lists are memory-mapped).
+    """
+    with atomic_path(index_path) as tmp_path:
+        faiss.write_index(index, tmp_path)
+
+
+def build_binary_index(embeddings: np.ndarray) -> faiss.IndexBinaryFlat:
+    """Build a 1-bit-per-dimension (sign) index for Hamming pre-filtering.
+
+    The retriever reranks its candidates with the full-precision index.
+    """
+    codes = np.packbits(embeddings > 0, axis=1)
+    index = faiss.IndexBinaryFlat(embeddings.shape[1])
+    index.add(codes)
+    return index
+
+
+def write_binary_index(embeddings: np.ndarray, cache_dir: str) -> Optional[str]:
+    """Write the binary prefilter if CODEX_BINARY_INDEX=1, otherwise remove a stale one.
+
+    Every index build must call this: a prefilter left over from an earlier
+    corpus would hand the retriever ids that don't match the new index.
+    Returns the path written, or None.
+    """
+    binary_path = os.path.join(cache_dir, BINARY_INDEX_FILE)
+    if os.environ.get("CODEX_BINARY_INDEX") == "1":
+        with atomic_path(binary_path) as tmp_path:
+            faiss.write_index_binary(build_binary_index(embeddings), tmp_path)
+        return binary_path
+
+    if os.path.exists(binary_path):
+        os.remove(binary_path)
+        logger.info(f"Removed stale binary index {binary_path}")
+    return None
@@ -5,37 +5,102 @@ Uses proper embedding model for queries to match index quality
 import os
 import json
 import sys
-from typing import Dict, List
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+from rag.chunk_store import ChunkStore
+from rag.index_factory import BINARY_INDEX_FILE
+from utils.caching import TTLCache
 from utils.logging_utils import get_logger
 
 logger = get_logger("codex.retriever")
 
-# Global model instance
+# Queries are searched one at a time against a small index, where OpenMP
+# fork/join costs more than the search itself
+faiss.omp_set_num_threads(1)
+
+# Query-time ANN search profiles (only apply to IVF / HNSW indexes; flat search is exact).
+# Select with CODEX_ANN_PROFILE; CODEX_ANN_EF overrides HNSW efSearch.
+ANN_PROFILES = {
+    "fast": {"nprobe": 2, "ef_search": 32},
+    "balanced": {"nprobe": 4, "ef_search": 64},
+    "recall-max": {"nprobe": 16, "ef_search": 256},
+}
+
+# Candidates fetched from the binary prefilter index before FP32 reranking
+BINARY_RERANK_CANDIDATES = 20
+
+# Global model and index instances
 _model = None
+_model_load_failed = False
+_index = None
+_binary_index = None
+_metadata = None
+_index_lock = threading.Lock()
+
+# Memoized query embeddings and retrievals, so Streamlit reruns with an
+# unchanged question skip the encoder forward pass and the FAISS search
+_embedding_cache = TTLCache(max_entries=1024, ttl=3600)
+_retrieval_cache = TTLCache(max_entries=256, ttl=3600)
 
 def get_embedding_model():
     """Get or load embedding model singleton"""
-    global _model
-    if _model is None:
+    global _model, _model_load_failed
+    if _model is None and not _model_load_failed:
         try:
+            # Deferred: importing sentence-transformers pulls in torch (seconds)
+            from sentence_transformers import SentenceTransformer
+
             _model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+            _model.eval()
+            # First forward pass allocates buffers / picks kernels; pay it at load time
+            _model.encode(["warmup"], convert_to_numpy=True, show_progress_bar=False)
             logger.info("Loaded embedding model: all-MiniLM-L6-v2")
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
-            # Keep the simple fallback as backup
+            # Don't retry the load on every query
             _model = None
+            _model_load_failed = True
     return _model
 
+def configure_search(index):
+    """Apply the selected ANN profile to an IVF or HNSW index"""
+    profile_name = os.environ.get("CODEX_ANN_PROFILE", "balanced")
+    profile = ANN_PROFILES.get(profile_name)
+    if profile is None:
+        logger.warning(f"Unknown CODEX_ANN_PROFILE '{profile_name}', using 'balanced'")
+        profile = ANN_PROFILES["balanced"]
+
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = profile["nprobe"]
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(os.environ.get("CODEX_ANN_EF", profile["ef_search"]))
+
 def load_prebuilt_index():
-    """Load pre-built FAISS index and metadata"""
+    """Load pre-built FAISS index and metadata (once per process)"""
+    if _index is not None and _metadata is not None:
+        return _index, _metadata
+
+    # Concurrent sessions on a cold process should load the index only once
+    with _index_lock:
+        if _index is not None and _metadata is not None:
+            return _index, _metadata
+        return _read_prebuilt_index()
+
+def _read_prebuilt_index():
+    global _index, _binary_index, _metadata
     cache_dir = os.path.join(os.path.dirname(__file__), "cache")
     index_path = os.path.join(cache_dir, "index.faiss")
     meta_path = os.path.join(cache_dir, "meta.json")
@@ -45,69 +110,143 @@ def load_prebuilt_index():
             f"Pre-built index not found. Run 'python scripts/build_embeddings_local.py' locally first."
         )
     
-    index = faiss.read_index(index_path)
+    # IO_FLAG_MMAP only maps IVF inverted lists (faiss 1.8); flat, SQ8 and HNSW
+    # indexes are still read into RAM, so small corpora load as before
+    try:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        logger.warning(f"Index load with IO_FLAG_MMAP failed, reading normally: {e}")
+        index = faiss.read_index(index_path)
+    configure_search(index)
+
+    # Optional sign-bit index built with CODEX_BINARY_INDEX=1
+    binary_path = os.path.join(cache_dir, BINARY_INDEX_FILE)
+    if os.path.exists(binary_path):
+        binary_index = faiss.read_index_binary(binary_path)
+        if _supports_binary_rerank(index, binary_index):
+            _binary_index = binary_index
+            logger.info("Loaded binary prefilter index")
     
-    with open(meta_path, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
+    with open(meta_path, "rb") as f:
+        raw = f.read()
+    metadata = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    # Newer builds keep chunks in a memory-mapped columnar store, not in meta.json
+    if "chunks" not in metadata:
+        metadata["chunks"] = ChunkStore(cache_dir)
     
     logger.info(f"Loaded pre-built index with {metadata['count']} chunks")
+    _index, _metadata = index, metadata
     return index, metadata
 
-def embed_query_simple(query: str, dimension: int = 384) -> np.ndarray:
+def _supports_binary_rerank(index, binary_index) -> bool:
+    """Check once, at load, that candidates from the binary index can be reranked"""
+    if binary_index.ntotal != index.ntotal:
+        logger.warning(
+            f"Ignoring binary index: {binary_index.ntotal} vectors vs {index.ntotal} in the main index"
+        )
+        return False
+    try:
+        # IVF indexes can only reconstruct by id through a direct map
+        if isinstance(index, faiss.IndexIVF):
+            index.make_direct_map()
+        if index.ntotal:
+            index.reconstruct_batch(np.zeros(1, dtype="int64"))
+    except RuntimeError as e:
+        logger.warning(f"Ignoring binary index: {type(index).__name__} can't reconstruct vectors ({e})")
+        return False
+    return True
+
+def search_index(index, query_embedding: np.ndarray, k: int):
     """
-    Fallback simple query embedding (lower quality)
+    Search the prebuilt index; with a binary index, Hamming-prefilter then rerank in FP32
     """
-    words = query.lower().split()
-    embedding = np.zeros(dimension, dtype='float32')
-    
-    for i, word in enumerate(words):
-        if len(word) > 2:
-            hash1 = hash(word) % dimension
-            hash2 = hash(word[::-1]) % dimension
-            weight = 1.0 / (i + 1)
-            embedding[hash1] += weight
-            embedding[hash2] += weight * 0.7
-    
-    # Normalize
-    norm = np.linalg.norm(embedding)
-    if norm > 0:
-        embedding = embedding / norm
-    
-    return embedding.reshape(1, -1)
+    if _binary_index is None:
+        return index.search(query_embedding, k)
+
+    candidates = min(max(k, BINARY_RERANK_CANDIDATES), _binary_index.ntotal)
+    _, ids = _binary_index.search(np.packbits(query_embedding > 0, axis=1), candidates)
+    ids = ids[0][ids[0] != -1]
+    vectors = index.reconstruct_batch(ids)
+
+    scores = vectors @ query_embedding[0]
+    order = np.argsort(-scores)[:k]
+    return scores[order].reshape(1, -1), ids[order].reshape(1, -1)
 
 def embed_query_proper(query: str) -> np.ndarray:
     """
-    Proper query embedding using same model as index
+    Proper query embedding using same model as index, L2-normalized by the encoder
     """
     model = get_embedding_model()
     if model is None:
-        logger.warning("Using fallback embedding - quality will be reduced")
-        return embed_query_simple(query)
+        raise RuntimeError("Embedding model unavailable; cannot embed query")
     
-    try:
-        embedding = model.encode([query], convert_to_numpy=True, show_progress_bar=False)
-        return embedding.astype('float32')
-    except Exception as e:
-        logger.error(f"Failed to encode query: {e}")
-        return embed_query_simple(query)
+    embedding = model.encode(
+        [query], convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+    )
+    # Already float32 from the encoder; only copy if a build hands back another dtype
+    return embedding.astype('float32', copy=False)
+
+def embed_query(query: str) -> np.ndarray:
+    """
+    Embed a query and L2-normalize it for cosine similarity search
+    """
+    query_embedding = _embedding_cache.get(query)
+    if query_embedding is None:
+        query_embedding = embed_query_proper(query)
+        _embedding_cache.put(query, query_embedding)
+    return query_embedding
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """
+    Embed several queries in one batched forward pass, L2-normalized
+    """
+    model = get_embedding_model()
+    if model is None:
+        raise RuntimeError("Embedding model unavailable; cannot embed queries")
+
+    embeddings = model.encode(
+        list(queries), batch_size=max(1, len(queries)), convert_to_numpy=True,
+        normalize_embeddings=True, show_progress_bar=False
+    )
+    return embeddings.astype('float32', copy=False)
+
+def prewarm(queries: List[str]):
+    """
+    Pre-embed likely queries (e.g. quick-start questions) so their first use hits the cache
+    """
+    missing = [q for q in queries if _embedding_cache.get(q) is None]
+    if not missing or get_embedding_model() is None:
+        return
+    for query, embedding in zip(missing, embed_queries(missing)):
+        _embedding_cache.put(query, embedding.reshape(1, -1))
+    logger.info(f"Pre-embedded {len(missing)} queries")
+
+def retrieve_with_prebuilt(query: str, top_k: int = 4, prioritize_reflection: bool = False,
+                           query_embedding: Optional[np.ndarray] = None) -> Dict:
+    """Retrieve relevant chunks using pre-built index
+
+    Pass ``query_embedding`` (from ``embed_query``) to reuse an embedding the
+    caller already computed.
+    """
+    cache_key = (query, top_k, prioritize_reflection)
+    cached = _retrieval_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-def retrieve_with_prebuilt(query: str, top_k: int = 4, prioritize_reflection: bool = False) -> Dict:
-    """Retrieve relevant chunks using pre-built index"""
     try:
         index, metadata = load_prebuilt_index()
         
         # Use proper embedding model for query (same as used for index)
-        query_embedding = embed_query_proper(query)
-        
-        # Normalize for cosine similarity
-        faiss.normalize_L2(query_embedding)
+        if query_embedding is None:
+            query_embedding = embed_query(query)
         
         # Search with more candidates
         search_k = min(top_k * 3, len(metadata["chunks"]))
-        scores, indices = index.search(query_embedding, search_k)
+        scores, indices = search_index(index, query_embedding, search_k)
         
         results = []
-        seen_sources = set()
+        per_source = defaultdict(int)
+        boosted = False
         
         for score, idx in zip(scores[0], indices[0]):
             if idx == -1:
@@ -119,36 +258,49 @@ def retrieve_with_prebuilt(query: str, top_k: int = 4, prioritize_reflection: bo
             # Boost reflection documents if requested
             if prioritize_reflection and "self_reflection" in source_path.lower():
                 score *= 1.3
+                boosted = True
             
             # Limit results per source for diversity
-            source_count = sum(1 for r in results if r["source"] == source_path)
-            if source_count >= 2:
+            if per_source[source_path] >= 2:
                 continue
                 
             results.append({
                 "text": chunk["text"],
                 "source": source_path,
+                "filename": os.path.basename(source_path),
                 "heading": chunk.get("heading", ""),
                 "score": float(score)
             })
+            per_source[source_path] += 1
             
             if len(results) >= top_k:
                 break
         
-        # Sort by score (highest first)
-        results.sort(key=lambda x: x["score"], reverse=True)
+        # FAISS already returns candidates best-first; only a boost can reorder them
+        if boosted:
+            results.sort(key=lambda x: x["score"], reverse=True)
         
-        return {
+        # Parallel columns for callers that assemble prompts/footers (SoA)
+        retrieval = {
             "results": results,
+            "filenames": [r["filename"] for r in results],
+            "headings": [r["heading"] for r in results],
+            "texts": [r["text"] for r in results],
             "count": len(results),
-            "max_score": max([r["score"] for r in results]) if results else 0.0,
-            "avg_score": sum([r["score"] for r in results]) / len(results) if results else 0.0,
+            # results are best-first, so the max is the first score
+            "max_score": results[0]["score"] if results else 0.0,
+            "avg_score": sum(r["score"] for r in results) / len(results) if results else 0.0,
         }
+        _retrieval_cache.put(cache_key, retrieval)
+        return retrieval
         
     except Exception as e:
         logger.error(f"Retrieval failed: {e}")
         return {
             "results": [],
+            "filenames": [],
+            "headings": [],
+            "texts": [],
             "count": 0,
             "max_score": 0.0,
             "avg_score": 0.0,
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import os
+import hashlib
 import json
 import sys
-from typing import Dict, List
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -11,51 +14,61 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import faiss
 import numpy as np
 
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+from rag.chunk_store import OFFSETS, ChunkStore
 from utils.logging_utils import get_logger
 
 logger = get_logger("codex.retriever")
 
+# Single-query search: skip OpenMP thread startup
+faiss.omp_set_num_threads(1)
+
+# Loaded (index, metadata) keyed by the mtimes of the index, meta.json and the
+# chunk store, so a rebuild is picked up once every file has been rewritten
+# while repeat queries skip FAISS deserialization and JSON parsing
+_index_cache: Dict[Tuple, tuple] = {}
+_index_lock = threading.Lock()
+
+def _hash_buckets(tokens: List[str], dim: int) -> np.ndarray:
+    """Map tokens to buckets with a stable hash (hash() is salted per process)"""
+    digests = b"".join(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest() for t in tokens)
+    return (np.frombuffer(digests, dtype=np.uint64) % dim).astype(np.intp)
+
+
 def embed_query_simple(query: str) -> np.ndarray:
     """
     Simple query embedding without sentence-transformers for deployment
     Uses basic TF-IDF-like approach
     """
-    try:
-        words = query.lower().split()
-        
-        # Create a simple bag-of-words embedding
-        embedding_dim = 384  # Match all-MiniLM-L6-v2 dimension
-        embedding = np.zeros(embedding_dim, dtype='float32')
-        
-        for i, word in enumerate(words[:20]):  # Limit to first 20 words
-            # Simple hash-based approach with position weighting
-            hash_val = abs(hash(word)) % embedding_dim
-            embedding[hash_val] += 1.0 / (i + 1)  # Give more weight to earlier words
-        
-        # Add some word-pair features for better matching
-        for i in range(len(words) - 1):
-            if i < 10:  # Limit bigrams
-                bigram = words[i] + "_" + words[i + 1]
-                hash_val = abs(hash(bigram)) % embedding_dim
-                embedding[hash_val] += 0.5 / (i + 1)
-        
-        # Normalize
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
-            
-        return embedding.reshape(1, -1)
-        
-    except Exception as e:
-        logger.error(f"Failed to create query embedding: {e}")
-        # Ultra-simple fallback
-        embedding = np.random.random(384).astype('float32')
-        embedding = embedding / np.linalg.norm(embedding)
-        return embedding.reshape(1, -1)
+    words = query.lower().split()
+    embedding_dim = 384  # Match all-MiniLM-L6-v2 dimension
+
+    # Bag of words (first 20, earlier words weigh more) plus the first 10 bigrams
+    unigrams = words[:20]
+    bigrams = [a + "_" + b for a, b in zip(words[:10], words[1:11])]
+    weights = np.concatenate([
+        1.0 / np.arange(1, len(unigrams) + 1),
+        0.5 / np.arange(1, len(bigrams) + 1),
+    ]).astype('float32')
+
+    embedding = np.zeros(embedding_dim, dtype='float32')
+    # add.at accumulates repeated buckets, unlike fancy-index +=
+    np.add.at(embedding, _hash_buckets(unigrams + bigrams, embedding_dim), weights)
+
+    # Normalize
+    norm = np.sqrt(embedding.dot(embedding))
+    if norm > 0:
+        embedding /= norm
+
+    return embedding.reshape(1, -1)
 
 
 def load_index():
-    """Load pre-built FAISS index and metadata"""
+    """Load pre-built FAISS index and metadata (cached until any of the files change)"""
     cache_dir = os.path.join(os.path.dirname(__file__), "cache")
     index_path = os.path.join(cache_dir, "index.faiss")
     meta_path = os.path.join(cache_dir, "meta.json")
@@ -65,10 +78,46 @@ def load_index():
             f"Pre-built index not found. Run 'python scripts/build_embeddings_local.py' locally first."
         )
 
-    index = faiss.read_index(index_path)
+    # Builders write these files one after another; keying on all of them means
+    # a load that raced a rebuild is replaced when the last file lands
+    cache_key = tuple(_mtime_ns(p) for p in (index_path, meta_path, os.path.join(cache_dir, OFFSETS)))
+    cached = _index_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    with _index_lock:
+        # Another thread may have loaded it while we waited
+        cached = _index_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        loaded = _read_index_and_meta(cache_dir, index_path, meta_path)
+        _index_cache.clear()
+        _index_cache[cache_key] = loaded
+        return loaded
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None  # e.g. no chunk store for builds that keep chunks in meta.json
 
-    with open(meta_path, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
+
+def _read_index_and_meta(cache_dir: str, index_path: str, meta_path: str):
+    # Only IVF inverted lists are actually mapped (see retriever_deployment).
+    # Treat the index as read-only: rebuild and rewrite the file, never add() to it
+    try:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        logger.warning(f"Index load with IO_FLAG_MMAP failed, reading normally: {e}")
+        index = faiss.read_index(index_path)
+
+    with open(meta_path, "rb") as f:
+        raw = f.read()
+    metadata = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    # Newer builds keep chunks in a memory-mapped columnar store, not in meta.json
+    if "chunks" not in metadata:
+        metadata["chunks"] = ChunkStore(cache_dir)
 
     logger.info(f"Loaded pre-built index with {metadata['count']} chunks")
     return index, metadata
@@ -80,18 +129,15 @@ def retrieve(query: str, top_k: int = 4, prioritize_reflection: bool = False) ->
         index, metadata = load_index()
 
         # Create simple query embedding (no sentence-transformers needed)
+        # (already float32 and L2-normalized for cosine similarity)
         query_embedding = embed_query_simple(query)
-        query_embedding = query_embedding.astype('float32')
-
-        # Normalize for cosine similarity
-        faiss.normalize_L2(query_embedding)
 
         # Search
         search_k = min(top_k * 2, len(metadata["chunks"]))  # Get more candidates
         scores, indices = index.search(query_embedding, search_k)
 
         results = []
-        seen_sources = set()
+        per_source = defaultdict(int)
 
         for score, idx in zip(scores[0], indices[0]):
             if idx == -1:  # FAISS returns -1 for not found
@@ -105,18 +151,18 @@ def retrieve(query: str, top_k: int = 4, prioritize_reflection: bool = False) ->
                 score *= 1.2
 
             # Limit results per source for diversity
-            source_count = sum(1 for r in results if r["source"] == source_path)
-            if source_count >= 2:
+            if per_source[source_path] >= 2:
                 continue
 
             results.append({
                 "text": chunk["text"],
                 "source": source_path,
+                "filename": os.path.basename(source_path),
                 "heading": chunk.get("heading", ""),
                 "score": float(score)
             })
 
-            seen_sources.add(source_path)
+            per_source[source_path] += 1
 
             if len(results) >= top_k:
                 break
@@ -127,8 +173,9 @@ def retrieve(query: str, top_k: int = 4, prioritize_reflection: bool = False) ->
         return {
             "results": results,
             "count": len(results),
-            "max_score": max([r["score"] for r in results]) if results else 0.0,
-            "avg_score": sum([r["score"] for r in results]) / len(results) if results else 0.0,
+            # results are best-first, so the max is the first score
+            "max_score": results[0]["score"] if results else 0.0,
+            "avg_score": sum(r["score"] for r in results) / len(results) if results else 0.0,
         }
 
     except Exception as e:
@@ -0,0 +1,262 @@
+"""
+Response cache in front of the LLM call.
+Exact matches hit an LRU dict; near-duplicate questions hit a FAISS
+inner-product index over normalized question embeddings.
+Optionally backed by SQLite so entries survive process restarts.
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from utils.logging_utils import get_logger
+
+logger = get_logger("codex.semantic_cache")
+
+CacheKey = Tuple[str, str, bool]
+
+# Answers older than this (since they were generated, not last used) expire
+ENTRY_TTL = 7 * 24 * 3600
+
+# Bump when the semcache table layout changes; old tables are dropped
+SCHEMA_VERSION = 3
+
+# Rows are keyed by fingerprint too, so workers started before and after a
+# rebuild each keep their own answers instead of wiping each other's
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS semcache (
+    fingerprint TEXT NOT NULL,
+    question TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    reflective INTEGER NOT NULL,
+    answer TEXT NOT NULL,
+    retrieval TEXT NOT NULL,
+    emb BLOB,
+    created REAL NOT NULL,
+    ts REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fingerprint, question, mode, reflective)
+)
+"""
+_META_SCHEMA = "CREATE TABLE IF NOT EXISTS semcache_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+
+# Re-putting an answer replaces it but keeps its hit count
+_UPSERT = """
+INSERT INTO semcache (fingerprint, question, mode, reflective, answer, retrieval, emb, created, ts)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (fingerprint, question, mode, reflective) DO UPDATE SET
+    answer = excluded.answer, retrieval = excluded.retrieval, emb = excluded.emb,
+    created = excluded.created, ts = excluded.ts
+"""
+_KEY_WHERE = "WHERE fingerprint = ? AND question = ? AND mode = ? AND reflective = ?"
+
+
+def make_key(question: str, mode: str, reflective: bool) -> CacheKey:
+    return (question.strip().lower(), mode, reflective)
+
+
+class SemanticCache:
+    """Cache answers keyed on (question, mode, reflective) with a cosine fallback
+
+    Entries expire ``ttl`` seconds after they were stored. With ``path``,
+    entries are also written to a SQLite file and reloaded (most recently used
+    first, up to ``max_entries``) on construction. ``fingerprint`` identifies
+    what the answers were generated from (index, prompts, ...); only rows
+    stored under the same fingerprint are loaded. Writes go through a
+    background thread and are committed in batches, so cache hits never wait
+    on the disk.
+    """
+
+    def __init__(self, dimension: int = 384, threshold: float = 0.95, max_entries: int = 256,
+                 ttl: float = ENTRY_TTL, path: Optional[str] = None, fingerprint: str = ""):
+        self.dimension = dimension
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[int, str, Dict, float]]" = OrderedDict()
+        self._keys_by_id: Dict[int, CacheKey] = {}
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._fingerprint = fingerprint
+        self._writes: "queue.Queue[Tuple[str, tuple]]" = queue.Queue()
+        if path is not None:
+            self._open(path, fingerprint)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, question: str, mode: str, reflective: bool,
+            query_embedding: Optional[np.ndarray] = None) -> Optional[Tuple[str, Dict]]:
+        """Return (answer, retrieval) for an exact or near-duplicate question"""
+        key = make_key(question, mode, reflective)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(key, entry):
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._touch(key)
+                return entry[1], entry[2]
+
+            if query_embedding is None or self._index.ntotal == 0:
+                return None
+
+            search_k = min(8, self._index.ntotal)
+            scores, ids = self._index.search(query_embedding.reshape(1, -1), search_k)
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id == -1 or score < self.threshold:
+                    break
+                cached_key = self._keys_by_id.get(int(entry_id))
+                # Only reuse answers produced under the same settings
+                if cached_key is None or cached_key[1:] != key[1:]:
+                    continue
+                if self._expired(cached_key, self._entries[cached_key]):
+                    continue
+                self._entries.move_to_end(cached_key)
+                self._touch(cached_key)
+                _, answer, retrieval, _ = self._entries[cached_key]
+                logger.info(f"Semantic cache hit (cosine={float(score):.3f})")
+                return answer, retrieval
+        return None
+
+    def put(self, question: str, mode: str, reflective: bool, answer: str, retrieval: Dict,
+            query_embedding: Optional[np.ndarray] = None):
+        """Store an answer, evicting the least recently used entry when full"""
+        key = make_key(question, mode, reflective)
+        vector = None
+        if query_embedding is not None:
+            vector = np.ascontiguousarray(query_embedding, dtype="float32").reshape(1, -1)
+
+        now = time.time()
+        with self._lock:
+            self._insert(key, answer, retrieval, vector, now)
+            self._execute(
+                _UPSERT,
+                (self._fingerprint, *key, answer, json.dumps(retrieval),
+                 vector.tobytes() if vector is not None else None, now, now),
+            )
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _insert(self, key: CacheKey, answer: str, retrieval: Dict, vector: Optional[np.ndarray],
+                created: float):
+        if key in self._entries:
+            self._remove(key, persist=False)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[key] = (entry_id, answer, retrieval, created)
+        self._keys_by_id[entry_id] = key
+
+        if vector is not None:
+            self._index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+
+    def _remove(self, key: CacheKey, persist: bool = True):
+        entry_id, _, _, _ = self._entries.pop(key)
+        self._keys_by_id.pop(entry_id, None)
+        self._index.remove_ids(np.array([entry_id], dtype="int64"))
+        if persist:
+            self._execute(f"DELETE FROM semcache {_KEY_WHERE}", (self._fingerprint, *key))
+
+    def _expired(self, key: CacheKey, entry: Tuple[int, str, Dict, float]) -> bool:
+        if time.time() - entry[3] <= self.ttl:
+            return False
+        self._remove(key)
+        return True
+
+    def _open(self, path: str, fingerprint: str):
+        """Open (or create) the SQLite store, drop expired rows and load this fingerprint's"""
+        version = str(SCHEMA_VERSION)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # Used here during load, then only by the writer thread
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute(_META_SCHEMA)
+            stored = self._db.execute("SELECT value FROM semcache_meta WHERE key = 'version'").fetchone()
+            if stored is None or stored[0] != version:
+                # One-time migration from an older table layout
+                self._db.execute("DROP TABLE IF EXISTS semcache")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO semcache_meta (key, value) VALUES ('version', ?)", (version,)
+                )
+            self._db.execute(_SCHEMA)
+            # Also ages out rows left behind by superseded fingerprints
+            self._db.execute("DELETE FROM semcache WHERE created < ?", (time.time() - self.ttl,))
+            rows = self._db.execute(
+                "SELECT question, mode, reflective, answer, retrieval, emb, created FROM semcache "
+                "WHERE fingerprint = ? ORDER BY ts DESC LIMIT ?", (fingerprint, self.max_entries)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache persistence disabled: {e}")
+            self._db = None
+            return
+
+        loaded = 0
+        # Oldest first, so the OrderedDict ends up in LRU order
+        for question, mode, reflective, answer, retrieval, emb, created in reversed(rows):
+            key = (question, mode, bool(reflective))
+            try:
+                retrieval = json.loads(retrieval)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Dropping unreadable semantic cache row: {e}")
+                self._execute(f"DELETE FROM semcache {_KEY_WHERE}", (fingerprint, *key))
+                continue
+            vector = None
+            if isinstance(emb, bytes) and len(emb) == self.dimension * 4:
+                vector = np.frombuffer(emb, dtype="float32").reshape(1, -1)
+            self._insert(key, answer, retrieval, vector, created)
+            loaded += 1
+        logger.info(f"Loaded {loaded} persisted semantic cache entries")
+        threading.Thread(target=self._write_loop, name="semcache-writer", daemon=True).start()
+
+    def _touch(self, key: CacheKey):
+        # Hits refresh LRU order only; expiry still counts from `created`
+        self._execute(
+            f"UPDATE semcache SET ts = ?, hits = hits + 1 {_KEY_WHERE}",
+            (time.time(), self._fingerprint, *key),
+        )
+
+    def flush(self):
+        """Block until every queued write has been committed"""
+        if self._db is not None:
+            self._writes.join()
+
+    def _execute(self, sql: str, params: tuple):
+        # Queued, not run: the writer thread commits it with its batch
+        if self._db is not None:
+            self._writes.put((sql, params))
+
+    def _write_loop(self):
+        """Drain queued writes and commit each batch in one transaction (one fsync)"""
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._db.execute("BEGIN")
+                for sql, params in batch:
+                    self._db.execute(sql, params)
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                # A failing store must never break answering questions
+                logger.warning(f"Semantic cache write failed: {e}")
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
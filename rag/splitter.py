@@ -1,24 +1,29 @@
 from __future__ import annotations
 
-import re
 from typing import List, Dict
 
+# Same lines as r"^#{1,3} ", but a C-level prefix check instead of a regex
+_HEADING_PREFIXES = ("# ", "## ", "### ")
 
-def _heading_path(lines: List[str], idx: int) -> str:
-    """Backtrack to build a heading path like H1 > H2 > H3 for a given line index."""
+
+def _heading_paths(lines: List[str]) -> List[str]:
+    """Heading path like H1 > H2 > H3 for every line, in one forward pass.
+
+    Each level is the nearest heading of that level at or above the line.
+    """
     h1 = h2 = h3 = None
-    for i in range(idx, -1, -1):
-        line = lines[i].strip()
-        if line.startswith("### ") and not h3:
+    paths: List[str] = []
+    for raw in lines:
+        line = raw.strip()
+        if line.startswith("### "):
             h3 = line[4:].strip()
-        elif line.startswith("## ") and not h2:
+        elif line.startswith("## "):
             h2 = line[3:].strip()
-        elif line.startswith("# ") and not h1:
+        elif line.startswith("# "):
             h1 = line[2:].strip()
-        if h1 and h2 and h3:
-            break
-    parts = [p for p in [h1, h2, h3] if p]
-    return " > ".join(parts) if parts else "Document"
+        parts = [p for p in (h1, h2, h3) if p]
+        paths.append(" > ".join(parts) if parts else "Document")
+    return paths
 
 
 def split_markdown(md_text: str, source_path: str, target_words: int = 950, overlap_words: int = 120) -> List[Dict]:
@@ -29,15 +34,14 @@ def split_markdown(md_text: str, source_path: str, target_words: int = 950, over
     lines = md_text.splitlines()
     chunks: List[Dict] = []
 
-    # Identify section boundaries by headings (#, ##, ###)
+    # Identify section boundaries by headings (#, ##, ###); indices are
+    # ascending, so only line 0 can repeat the initial boundary
     boundaries = [0]
     for i, line in enumerate(lines):
-        if re.match(r"^#{1,3} ", line):
-            if i not in boundaries:
-                boundaries.append(i)
-    if len(lines) not in boundaries:
+        if i and line.startswith(_HEADING_PREFIXES):
+            boundaries.append(i)
+    if boundaries[-1] != len(lines):
         boundaries.append(len(lines))
-    boundaries = sorted(set(boundaries))
 
     # Build sections
     sections: List[str] = []
@@ -49,18 +53,20 @@ def split_markdown(md_text: str, source_path: str, target_words: int = 950, over
             sections.append(section)
             section_starts.append(start)
 
+    heading_paths = _heading_paths(lines)
+
     # Further split sections into word-bounded chunks with overlap
     for sec, start_idx in zip(sections, section_starts):
         words = sec.split()
         if not words:
             continue
+        heading = heading_paths[start_idx]
         step = max(1, target_words - overlap_words)
         for wstart in range(0, len(words), step):
             wend = min(len(words), wstart + target_words)
             text = " ".join(words[wstart:wend]).strip()
             if not text:
                 continue
-            heading = _heading_path(lines, start_idx)
             chunks.append({
                 "text": text,
                 "source": source_path,
@@ -5,15 +5,16 @@ Run this script locally before deploying to avoid model download issues.
 import os
 import sys
 import json
-import numpy as np
-import faiss
 from sentence_transformers import SentenceTransformer
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from utils.atomic_io import atomic_path
 from utils.loader import load_markdown_files
 from rag.splitter import split_markdown
+from rag.index_factory import build_faiss_index, encode_chunks, write_binary_index, write_faiss_index
+from rag.chunk_store import write_chunk_store
 
 def build_embeddings_locally():
     """Build embeddings locally and save for deployment"""
@@ -39,20 +40,15 @@ def build_embeddings_locally():
     model = SentenceTransformer('all-MiniLM-L6-v2')
     print(f" Loaded model: all-MiniLM-L6-v2")
     
-    # Create embeddings
+    # Create embeddings batch by batch, L2-normalized by the encoder for cosine similarity
     texts = [chunk["text"] for chunk in all_chunks]
-    embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-    embeddings = embeddings.astype('float32')
+    embeddings = encode_chunks(model, texts)
     
     print(f" Created embeddings shape: {embeddings.shape}")
     
-    # Normalize for cosine similarity
-    faiss.normalize_L2(embeddings)
-    
     # Build FAISS index
     dimension = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings)
+    index = build_faiss_index(embeddings)
     
     # Ensure cache directory exists
     cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "rag", "cache")
@@ -61,11 +57,14 @@ def build_embeddings_locally():
     # Save index and metadata
     index_path = os.path.join(cache_dir, "index.faiss")
     meta_path = os.path.join(cache_dir, "meta.json")
-    embeddings_path = os.path.join(cache_dir, "embeddings.npy")
     
     # Save everything
-    faiss.write_index(index, index_path)
-    np.save(embeddings_path, embeddings)
+    write_faiss_index(index, index_path)
+    
+    # Optional binary-quantized prefilter index (CODEX_BINARY_INDEX=1)
+    binary_path = write_binary_index(embeddings, cache_dir)
+    if binary_path:
+        print(f" Binary index saved to {binary_path}")
     
     metadata = {
         "chunks": all_chunks,
@@ -75,11 +74,14 @@ def build_embeddings_locally():
         "embedding_dim": embeddings.shape[1]
     }
     
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    # Chunks go to the columnar store; meta.json keeps only the header fields
+    write_chunk_store(all_chunks, cache_dir)
+    header = {k: v for k, v in metadata.items() if k != "chunks"}
+    with atomic_path(meta_path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2, ensure_ascii=False)
     
     print(f" Index saved to {index_path}")
-    print(f" Embeddings saved to {embeddings_path}")
+    print(f" Chunk store saved to {cache_dir}")
     print(f" Metadata saved to {meta_path}")
     print(f" Ready for deployment! {len(all_chunks)} chunks embedded.")
     
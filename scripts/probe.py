@@ -1,15 +1,19 @@
 from __future__ import annotations
 
 import os
+import sys
 import argparse
 from typing import List
 
 from dotenv import load_dotenv  # type: ignore
 from openai import OpenAI
 
-from rag.build_index import build_index
-from rag.retriever import retrieve
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.retriever_lite import retrieve
 from utils.loader import load_profile
+from utils.prompting import MODE_FILES, PROMPTS_DIR, get_mode_file, load_text
 
 
 def get_client() -> OpenAI:
@@ -25,15 +29,8 @@ def compose_answer(question: str, mode_label: str, reflective: bool, temperature
     r = retrieve(question, top_k=4, prioritize_reflection=reflective)
 
     # Build prompts
-    system = open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts", "system_base.txt"), "r", encoding="utf-8").read()
-    mode_file = {
-        "Interview": "mode_interview.txt",
-        "Storytelling": "mode_storytelling.txt",
-        "Fast Facts": "mode_fastfacts.txt",
-        "Humble Brag": "mode_humblebrag.txt",
-        "Reflective": "mode_reflective.txt",
-    }[mode_label]
-    mode_text = open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts", mode_file), "r", encoding="utf-8").read()
+    system = load_text(os.path.join(PROMPTS_DIR, "system_base.txt"))
+    mode_text = load_text(get_mode_file(mode_label))
 
     context = "\n\n".join([
         f"[Source: {os.path.basename(x['source'])}#{x['heading']}]\n{x['text']}" for x in r["results"]
@@ -68,13 +65,16 @@ def main():
 
     parser = argparse.ArgumentParser(description="Probe the Personal Codex Agent")
     parser.add_argument("question", type=str, help="Question to ask")
-    parser.add_argument("--mode", default="Interview", choices=["Interview", "Storytelling", "Fast Facts", "Humble Brag", "Reflective"])  # noqa: E501
+    parser.add_argument("--mode", default="Interview", choices=list(MODE_FILES))
     parser.add_argument("--rebuild", action="store_true", help="Rebuild the index before querying")
     parser.add_argument("--reflective", action="store_true", help="Bias retrieval toward self_reflection.md")
     parser.add_argument("--temp", type=float, default=0.4)
     args = parser.parse_args()
 
     if args.rebuild:
+        # Imported here: building needs sentence-transformers, querying doesn't
+        from rag.build_index_lite import build_index
+
         build_index()
 
     r, answer, sources = compose_answer(args.question, args.mode, args.reflective, args.temp)
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """Yield a temporary path next to ``path`` and move it over ``path`` on success.
+
+    ``os.replace`` swaps the directory entry, so a process that already opened
+    or memory-mapped the old file keeps reading the old contents instead of
+    seeing it truncated and rewritten underneath it.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
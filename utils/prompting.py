@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from typing import Dict
+
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts")
+
+MODE_FILES = {
+    "Interview": "mode_interview.txt",
+    "Storytelling": "mode_storytelling.txt",
+    "Fast Facts": "mode_fastfacts.txt",
+    "Humble Brag": "mode_humblebrag.txt",
+    "Reflective": "mode_reflective.txt",
+    "Humorous": "mode_humorous.txt",
+}
+_MODE_PATHS = {mode: os.path.join(PROMPTS_DIR, name) for mode, name in MODE_FILES.items()}
+SYSTEM_PROMPT_PATH = os.path.join(PROMPTS_DIR, "system_base.txt")
+
+
+@lru_cache(maxsize=16)
+def load_text(path: str) -> str:
+    """Read a prompt file once per process (prompts don't change at runtime)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def get_mode_file(mode: str) -> str:
+    return _MODE_PATHS[mode]
+
+
+def load_system_prompt() -> str:
+    return load_text(SYSTEM_PROMPT_PATH)
+
+
+@lru_cache(maxsize=1)
+def load_mode_texts() -> Dict[str, str]:
+    """Read every mode prompt up front so switching modes never hits disk."""
+    return {mode: load_text(path) for mode, path in _MODE_PATHS.items()}